@@ -2,13 +2,29 @@
 from __future__ import annotations
 
 import argparse
-import shutil
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Iterator
 
 import librosa
 import numpy as np
+import scipy.fft
 import soundfile as sf
 
+from io_utils import BIT_DEPTH_SUBTYPES, fast_copy
+
+try:
+    import pyrubberband
+except ImportError:
+    pyrubberband = None
+
+# Route librosa's STFT/ISTFT through scipy.fft so they honour scipy.fft.set_workers
+# (already the default from librosa 0.11, where set_fftlib is deprecated)
+if librosa.get_fftlib() is not scipy.fft:
+    librosa.set_fftlib(scipy.fft)
+
 
 SUPPORTED_AUDIO_EXTENSIONS = {
     ".wav",
@@ -30,6 +46,14 @@ SUPPORTED_AUDIO_EXTENSIONS = {
     ".opus",
 }
 
+PITCH_SHIFT_BACKENDS = ("librosa", "rubberband")
+
+# (semitone shift, output filename suffix) for each augmented version.
+AUGMENTATIONS = (
+    (-1, "down1st"),
+    (1, "up1st"),
+)
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -57,68 +81,182 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Overwrite output files if they already exist.",
     )
+    parser.add_argument(
+        "--hardlink",
+        action="store_true",
+        help="Hardlink copied originals and CSVs instead of copying them (outputs then share the source files).",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=PITCH_SHIFT_BACKENDS,
+        default="librosa",
+        help="Pitch-shift implementation; 'rubberband' needs pyrubberband and the rubberband CLI.",
+    )
+    parser.add_argument(
+        "--bit-depth",
+        choices=sorted(BIT_DEPTH_SUBTYPES),
+        default=None,
+        help="Sample format of written WAV files (default: soundfile's WAV default, 16-bit PCM).",
+    )
+    parser.add_argument(
+        "--fft-workers",
+        type=int,
+        default=1,
+        help="Threads per FFT inside each worker process (keep at 1 when --workers uses every core).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes used to augment files in parallel.",
+    )
     return parser.parse_args()
 
 
-def iter_audio_files(root: Path) -> list[Path]:
-    return sorted(
-        p
-        for p in root.rglob("*")
-        if p.is_file() and p.suffix.lower() in SUPPORTED_AUDIO_EXTENSIONS
-    )
+def iter_audio_files(root: Path) -> Iterator[Path]:
+    for p in root.rglob("*"):
+        if p.is_file() and p.suffix.lower() in SUPPORTED_AUDIO_EXTENSIONS:
+            yield p
+
+
+def _pitch_shift_multi(y: np.ndarray, sr: int, steps_list: list[float]) -> list[np.ndarray]:
+    # Same pipeline as librosa.effects.pitch_shift (time-stretch, then resample),
+    # but the forward STFT is computed once and shared by every shift amount.
+    # y is (..., samples); librosa processes all leading (channel) axes at once.
+    n_samples = y.shape[-1]
+    stft = librosa.stft(y)
+    shifted = []
+    for n_steps in steps_list:
+        rate = 2.0 ** (-float(n_steps) / 12)
+        stretched = librosa.istft(
+            librosa.phase_vocoder(stft, rate=rate),
+            dtype=y.dtype,
+            length=int(round(n_samples / rate)),
+        )
+        resampled = librosa.resample(stretched, orig_sr=float(sr) / rate, target_sr=sr)
+        shifted.append(librosa.util.fix_length(resampled, size=n_samples))
+    return shifted
+
 
+def pitch_shift_audio_multi(
+    audio: np.ndarray,
+    sr: int,
+    steps_list: list[float],
+    backend: str = "librosa",
+    fft_workers: int = 1,
+) -> list[np.ndarray]:
+    if backend == "rubberband":
+        if pyrubberband is None:
+            raise RuntimeError(
+                "The rubberband backend requires pyrubberband and the rubberband CLI."
+            )
+        # rubberband handles (samples, channels) arrays directly
+        return [
+            pyrubberband.pitch_shift(audio, sr, n_steps).astype(np.float32)
+            for n_steps in steps_list
+        ]
 
-def pitch_shift_audio(audio: np.ndarray, sr: int, semitones: float) -> np.ndarray:
     if audio.ndim == 1:
-        shifted = librosa.effects.pitch_shift(audio, sr=sr, n_steps=semitones)
-        return shifted.astype(np.float32)
+        with scipy.fft.set_workers(fft_workers):
+            shifted_list = _pitch_shift_multi(audio, sr, steps_list)
+        return [shifted.astype(np.float32) for shifted in shifted_list]
+
+    # soundfile returns (samples, channels); librosa expects channels first
+    channels_first = np.ascontiguousarray(audio.T)
+    with scipy.fft.set_workers(fft_workers):
+        shifted_list = _pitch_shift_multi(channels_first, sr, steps_list)
+    return [shifted.T.astype(np.float32) for shifted in shifted_list]
+
+
+def pitch_shift_audio(
+    audio: np.ndarray, sr: int, semitones: float, backend: str = "librosa"
+) -> np.ndarray:
+    return pitch_shift_audio_multi(audio, sr, [semitones], backend=backend)[0]
 
-    shifted_channels = []
-    for channel_idx in range(audio.shape[1]):
-        shifted_channel = librosa.effects.pitch_shift(
-            audio[:, channel_idx], sr=sr, n_steps=semitones
-        )
-        shifted_channels.append(shifted_channel)
-    shifted_stacked = np.stack(shifted_channels, axis=1)
-    return shifted_stacked.astype(np.float32)
+
+def augmented_destination(destination_base: Path, suffix: str) -> Path:
+    return destination_base.with_name(f"{destination_base.name}-{suffix}").with_suffix(".wav")
+
+
+def pending_augmentations(destination_base: Path, overwrite: bool) -> list[tuple[int, Path]]:
+    pending = []
+    for semitone_shift, suffix in AUGMENTATIONS:
+        destination_audio = augmented_destination(destination_base, suffix)
+        if overwrite or not destination_audio.exists():
+            pending.append((semitone_shift, destination_audio))
+    return pending
 
 
 def write_augmented_pair(
     source_audio: Path,
-    destination_base: Path,
+    destination_audio: Path,
     sr: int,
-    audio: np.ndarray,
-    semitone_shift: int,
-    suffix: str,
-    overwrite: bool,
-) -> bool:
-    destination_audio = destination_base.with_name(f"{destination_base.name}-{suffix}").with_suffix(
-        ".wav"
-    )
+    shifted: np.ndarray,
+    subtype: str | None = None,
+    hardlink: bool = False,
+) -> None:
     destination_csv = destination_audio.with_suffix(".csv")
-
-    if destination_audio.exists() and not overwrite:
-        return False
-
-    shifted = pitch_shift_audio(audio, sr=sr, semitones=semitone_shift)
-    sf.write(destination_audio, shifted, sr)
+    sf.write(destination_audio, shifted, sr, subtype=subtype)
 
     source_csv = source_audio.with_suffix(".csv")
     if source_csv.exists():
-        shutil.copy2(source_csv, destination_csv)
-
-    return True
+        fast_copy(source_csv, destination_csv, overwrite=True, hardlink=hardlink)
 
 
-def copy_original_files(source_audio: Path, destination_audio: Path, overwrite: bool) -> None:
+def copy_original_files(
+    source_audio: Path, destination_audio: Path, overwrite: bool, hardlink: bool = False
+) -> None:
     destination_audio.parent.mkdir(parents=True, exist_ok=True)
-    if overwrite or not destination_audio.exists():
-        shutil.copy2(source_audio, destination_audio)
+    fast_copy(source_audio, destination_audio, overwrite, hardlink=hardlink)
 
     source_csv = source_audio.with_suffix(".csv")
     destination_csv = destination_audio.with_suffix(".csv")
-    if source_csv.exists() and (overwrite or not destination_csv.exists()):
-        shutil.copy2(source_csv, destination_csv)
+    if source_csv.exists():
+        fast_copy(source_csv, destination_csv, overwrite, hardlink=hardlink)
+
+
+def process_one(
+    audio_path: Path,
+    input_dir: Path,
+    output_dir: Path,
+    overwrite: bool,
+    copy_originals: bool,
+    backend: str = "librosa",
+    subtype: str | None = None,
+    fft_workers: int = 1,
+    hardlink: bool = False,
+) -> tuple[int, int]:
+    destination_original = output_dir / audio_path.relative_to(input_dir)
+    destination_original.parent.mkdir(parents=True, exist_ok=True)
+
+    destination_base = destination_original.with_suffix("")
+    pending = pending_augmentations(destination_base, overwrite)
+
+    # Only decode the source when at least one augmented output is missing
+    if pending:
+        audio, sr = sf.read(audio_path, dtype="float32", always_2d=False)
+        shifted_list = pitch_shift_audio_multi(
+            audio,
+            sr,
+            [semitone_shift for semitone_shift, _ in pending],
+            backend=backend,
+            fft_workers=fft_workers,
+        )
+        for (_, destination_audio), shifted in zip(pending, shifted_list):
+            write_augmented_pair(
+                source_audio=audio_path,
+                destination_audio=destination_audio,
+                sr=sr,
+                shifted=shifted,
+                subtype=subtype,
+                hardlink=hardlink,
+            )
+
+    if copy_originals:
+        copy_original_files(audio_path, destination_original, overwrite, hardlink=hardlink)
+
+    created = len(pending)
+    return created, len(AUGMENTATIONS) - created
 
 
 def main() -> None:
@@ -129,52 +267,28 @@ def main() -> None:
     if not input_dir.exists():
         raise FileNotFoundError(f"Input directory does not exist: {input_dir}")
 
-    audio_files = iter_audio_files(input_dir)
+    audio_files = sorted(iter_audio_files(input_dir))
     if not audio_files:
         raise RuntimeError(f"No supported audio files found under: {input_dir}")
 
     created = 0
     skipped = 0
 
-    for audio_path in audio_files:
-        relative = audio_path.relative_to(input_dir)
-        destination_original = output_dir / relative
-        destination_original.parent.mkdir(parents=True, exist_ok=True)
-
-        audio, sr = sf.read(audio_path, dtype="float32", always_2d=False)
-        destination_base = destination_original.with_suffix("")
-
-        wrote_down = write_augmented_pair(
-            source_audio=audio_path,
-            destination_base=destination_base,
-            sr=sr,
-            audio=audio,
-            semitone_shift=-1,
-            suffix="down1st",
-            overwrite=args.overwrite,
-        )
-        wrote_up = write_augmented_pair(
-            source_audio=audio_path,
-            destination_base=destination_base,
-            sr=sr,
-            audio=audio,
-            semitone_shift=1,
-            suffix="up1st",
-            overwrite=args.overwrite,
-        )
-
-        if args.copy_originals:
-            copy_original_files(audio_path, destination_original, args.overwrite)
-
-        if wrote_down:
-            created += 1
-        else:
-            skipped += 1
-
-        if wrote_up:
-            created += 1
-        else:
-            skipped += 1
+    worker = partial(
+        process_one,
+        input_dir=input_dir,
+        output_dir=output_dir,
+        overwrite=args.overwrite,
+        copy_originals=args.copy_originals,
+        backend=args.backend,
+        subtype=BIT_DEPTH_SUBTYPES.get(args.bit_depth),
+        fft_workers=args.fft_workers,
+        hardlink=args.hardlink,
+    )
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for file_created, file_skipped in executor.map(worker, audio_files, chunksize=4):
+            created += file_created
+            skipped += file_skipped
 
     print(f"Processed source files: {len(audio_files)}")
     print(f"Augmented files created: {created}")
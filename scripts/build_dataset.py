@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from augment_transpose import (
+    PITCH_SHIFT_BACKENDS,
+    pending_augmentations,
+    pitch_shift_audio_multi,
+    write_augmented_pair,
+)
+from intensity_csv_generator import get_class_index
+from intensity_csv_generator import write_csv as write_intensity_csv
+from io_utils import BIT_DEPTH_SUBTYPES, fast_copy
+from lowpass_sweep import (
+    CUTOFF_BINS,
+    iter_audio_files,
+    positive_int,
+    write_lowpass_output,
+)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Run the transpose augmentation, low-pass sweep and intensity annotation "
+            "on each audio file, decoding every file only once."
+        )
+    )
+    parser.add_argument("--input-dir", type=Path, required=True, help="Input folder with audio files.")
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        required=True,
+        help="Output folder; results go to its augmented/, lowpass/ and intensity/ subfolders.",
+    )
+    parser.add_argument("--fps", type=int, default=75, help="Frames per second for CSV annotation.")
+    parser.add_argument("--overwrite", action="store_true", help="Overwrite output files if they exist.")
+    parser.add_argument(
+        "--backend",
+        choices=PITCH_SHIFT_BACKENDS,
+        default="librosa",
+        help="Pitch-shift implementation; 'rubberband' needs pyrubberband and the rubberband CLI.",
+    )
+    parser.add_argument(
+        "--cutoff-bins",
+        type=positive_int,
+        default=CUTOFF_BINS,
+        help="Number of filter designs used to approximate the cutoff sweep.",
+    )
+    parser.add_argument(
+        "--bit-depth",
+        choices=sorted(BIT_DEPTH_SUBTYPES),
+        default=None,
+        help="Sample format of written audio; ignored for formats that don't support it (default: the output format's default).",
+    )
+    parser.add_argument(
+        "--fft-workers",
+        type=int,
+        default=1,
+        help="Threads per FFT inside each worker process (keep at 1 when --workers uses every core).",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    return parser.parse_args()
+
+
+def process_one(
+    audio_path: Path,
+    input_dir: Path,
+    output_dir: Path,
+    class_list: list[str],
+    start_cutoff: float,
+    end_cutoff: float,
+    fps: int,
+    overwrite: bool,
+    backend: str = "librosa",
+    n_bins: int = CUTOFF_BINS,
+    subtype: str | None = None,
+    fft_workers: int = 1,
+) -> str:
+    class_name = audio_path.parent.name
+    info = sf.info(audio_path)
+    n_frames = max(1, int(round(info.frames / info.samplerate * fps)))
+    base_name = f"{class_name}_{audio_path.stem}{audio_path.suffix}"
+
+    destination_base = (output_dir / "augmented" / audio_path.relative_to(input_dir)).with_suffix("")
+    destination_base.parent.mkdir(parents=True, exist_ok=True)
+    pending = pending_augmentations(destination_base, overwrite)
+    lowpass_audio = output_dir / "lowpass" / base_name
+    lowpass_pending = overwrite or not lowpass_audio.exists()
+
+    # Only decode the source when a transposed or low-pass output is missing
+    if pending or lowpass_pending:
+        audio, sr = sf.read(audio_path, dtype="float32", always_2d=False)
+
+    # Transposed copies, as in augment_transpose
+    if pending:
+        shifted_list = pitch_shift_audio_multi(
+            audio,
+            sr,
+            [semitone_shift for semitone_shift, _ in pending],
+            backend=backend,
+            fft_workers=fft_workers,
+        )
+        for (_, destination_audio), shifted in zip(pending, shifted_list):
+            write_augmented_pair(
+                source_audio=audio_path,
+                destination_audio=destination_audio,
+                sr=sr,
+                shifted=shifted,
+                subtype=subtype,
+            )
+
+    # Low-pass sweep, as in lowpass_sweep
+    if lowpass_pending:
+        cutoff_seq = np.linspace(start_cutoff, end_cutoff, n_frames)
+        channels = 1 if audio.ndim == 1 else audio.shape[1]
+        write_lowpass_output(
+            lowpass_audio, [audio], sr, channels, cutoff_seq, class_list, n_bins, subtype
+        )
+
+    # Intensity annotation, as in intensity_csv_generator
+    intensity_audio = output_dir / "intensity" / base_name
+    fast_copy(audio_path, intensity_audio, overwrite)
+    intensity_csv = intensity_audio.with_suffix(".csv")
+    if overwrite or not intensity_csv.exists():
+        intensity_seq = np.linspace(100, 0, n_frames)
+        write_intensity_csv(intensity_csv, get_class_index(class_name, class_list), intensity_seq)
+
+    return f"Processed {audio_path.name}: {n_frames} frames, {len(pending)} transposed versions written"
+
+
+def main() -> None:
+    args = parse_args()
+    input_dir = args.input_dir.resolve()
+    output_dir = args.output_dir.resolve()
+    for subdir in ("augmented", "lowpass", "intensity"):
+        (output_dir / subdir).mkdir(parents=True, exist_ok=True)
+
+    # Load cutoff parameters and class list from parameters.json
+    param_path = Path(__file__).parent / "raw" / "parameters.json"
+    with param_path.open("r") as f:
+        params = json.load(f)
+    start_cutoff = params["parameter_2"]["start_cutoff"]
+    end_cutoff = params["parameter_2"]["end_cutoff"]
+    class_list = params["parameter_1"]["classes"]
+
+    audio_files = sorted(iter_audio_files(input_dir))
+    worker = partial(
+        process_one,
+        input_dir=input_dir,
+        output_dir=output_dir,
+        class_list=class_list,
+        start_cutoff=start_cutoff,
+        end_cutoff=end_cutoff,
+        fps=args.fps,
+        overwrite=args.overwrite,
+        backend=args.backend,
+        n_bins=args.cutoff_bins,
+        subtype=BIT_DEPTH_SUBTYPES.get(args.bit_depth),
+        fft_workers=args.fft_workers,
+    )
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for message in executor.map(worker, audio_files, chunksize=4):
+            print(message)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import csv
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-import shutil
+from typing import Iterator
+import numpy as np
 import soundfile as sf
 
+from io_utils import fast_copy
+
 SUPPORTED_AUDIO_EXTENSIONS = {
     ".wav",
     ".mp3",
@@ -27,22 +32,38 @@ SUPPORTED_AUDIO_EXTENSIONS = {
     ".opus",
 }
 
-def iter_audio_files(root: Path) -> list[Path]:
-    return sorted(
-        p
-        for p in root.rglob("*")
-        if p.is_file() and p.suffix.lower() in SUPPORTED_AUDIO_EXTENSIONS
-    )
+def iter_audio_files(root: Path) -> Iterator[Path]:
+    for p in root.rglob("*"):
+        if p.is_file() and p.suffix.lower() in SUPPORTED_AUDIO_EXTENSIONS:
+            yield p
 
 def get_class_index(class_name: str, class_list: list[str]) -> int:
     return class_list.index(class_name) if class_name in class_list else -1
 
-def write_csv(csv_path: Path, class_index: int, intensity_seq: list[float]) -> None:
+def write_csv(csv_path: Path, class_index: int, intensity_seq: np.ndarray) -> None:
+    # Same dialect as csv.writer and the committed raw/*.csv: CRLF rows, floats as repr(round(v, 2))
+    body = "\r\n".join(f"{class_index},{round(value, 2)}" for value in intensity_seq.tolist())
     with csv_path.open("w", newline="") as handle:
-        writer = csv.writer(handle)
-        writer.writerow(["class_index", "intensity"])
-        for value in intensity_seq:
-            writer.writerow([class_index, round(float(value), 2)])
+        handle.write("class_index,intensity\r\n" + body + "\r\n")
+
+def process_one(
+    audio_path: Path, output_dir: Path, class_list: list[str], fps: int, hardlink: bool = False
+) -> str:
+    class_name = audio_path.parent.name
+    class_index = get_class_index(class_name, class_list)
+    audio, sr = sf.read(audio_path, dtype="float32")
+    duration = len(audio) / sr
+    n_rows = max(1, int(round(duration * fps)))
+    intensity_seq = np.linspace(100, 0, n_rows)
+    # Copy audio file with class_name_filename format
+    audio_base_name = f"{class_name}_{audio_path.stem}{audio_path.suffix}"
+    out_audio = output_dir / audio_base_name
+    fast_copy(audio_path, out_audio, overwrite=True, hardlink=hardlink)
+    # Create CSV with matching base name
+    csv_base_name = f"{class_name}_{audio_path.stem}.csv"
+    out_csv = output_dir / csv_base_name
+    write_csv(out_csv, class_index, intensity_seq)
+    return f"Processed {audio_path.name}: {n_rows} rows, intensity 100->0, copied to {out_audio.name}"
 
 def main():
     import argparse
@@ -50,6 +71,12 @@ def main():
     parser.add_argument("--input-dir", type=Path, required=True, help="Input folder with audio files.")
     parser.add_argument("--output-dir", type=Path, required=True, help="Output folder for CSV files.")
     parser.add_argument("--fps", type=int, default=75, help="Rows per second of audio.")
+    parser.add_argument(
+        "--hardlink",
+        action="store_true",
+        help="Hardlink audio into output-dir instead of copying it (outputs then share the source files).",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes.")
     args = parser.parse_args()
 
     input_dir = args.input_dir.resolve()
@@ -62,24 +89,13 @@ def main():
         params = json.load(f)
     class_list = params["parameter_1"]["classes"]
 
-    audio_files = iter_audio_files(input_dir)
-    for audio_path in audio_files:
-        class_name = audio_path.parent.name
-        class_index = get_class_index(class_name, class_list)
-        audio, sr = sf.read(audio_path, dtype="float32")
-        duration = len(audio) / sr
-        n_rows = max(1, int(round(duration * args.fps)))
-        intensity_seq = list(np.linspace(100, 0, n_rows))
-        # Copy audio file with class_name_filename format
-        audio_base_name = f"{class_name}_{audio_path.stem}{audio_path.suffix}"
-        out_audio = output_dir / audio_base_name
-        shutil.copy(audio_path, out_audio)
-        # Create CSV with matching base name
-        csv_base_name = f"{class_name}_{audio_path.stem}.csv"
-        out_csv = output_dir / csv_base_name
-        write_csv(out_csv, class_index, intensity_seq)
-        print(f"Processed {audio_path.name}: {n_rows} rows, intensity 100->0, copied to {out_audio.name}")
+    audio_files = sorted(iter_audio_files(input_dir))
+    worker = partial(
+        process_one, output_dir=output_dir, class_list=class_list, fps=args.fps, hardlink=args.hardlink
+    )
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for message in executor.map(worker, audio_files, chunksize=4):
+            print(message)
 
 if __name__ == "__main__":
-    import numpy as np
     main()
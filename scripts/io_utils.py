@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import errno
+import os
+import shutil
+import sys
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+# FICLONE ioctl request from linux/fs.h; fcntl only exposes it from Python 3.12
+FICLONE = getattr(fcntl, "FICLONE", 0x40049409)
+
+# soundfile subtype for each --bit-depth choice; None keeps the format default
+BIT_DEPTH_SUBTYPES = {
+    "16": "PCM_16",
+    "24": "PCM_24",
+    "32f": "FLOAT",
+}
+
+# Devices where a copy-on-write clone already failed in this process
+_NO_REFLINK_DEVICES: set[int] = set()
+
+
+def _clone_file(src: Path, dst: Path) -> bool:
+    # Ask the filesystem for a copy-on-write clone (btrfs, XFS, ...) with an
+    # in-process ioctl; returns False when the clone is not possible.
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    src_dev = os.stat(src).st_dev
+    if src_dev in _NO_REFLINK_DEVICES or src_dev != os.stat(dst.parent).st_dev:
+        return False
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            # Not a copy-on-write filesystem; don't try again for this device
+            _NO_REFLINK_DEVICES.add(src_dev)
+            return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def fast_copy(src: Path, dst: Path, overwrite: bool, hardlink: bool = False) -> None:
+    # Clone copy-on-write when the filesystem supports it, so same-filesystem copies
+    # cost no data I/O. Hardlinks share the inode with the source, so an in-place
+    # edit of the output would change the source too; they are opt-in only.
+    if dst.exists():
+        if not overwrite or os.path.samefile(src, dst):
+            return
+        dst.unlink()
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return
+        except OSError as exc:
+            if exc.errno == errno.EXDEV:
+                shutil.copy2(src, dst)
+                return
+    if not _clone_file(src, dst):
+        shutil.copy2(src, dst)
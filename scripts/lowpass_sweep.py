@@ -3,14 +3,20 @@ from __future__ import annotations
 
 
 import argparse
-import csv
+import functools
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Iterable, Iterator
 
 import numpy as np
 import soundfile as sf
 import scipy.signal
 
+from io_utils import BIT_DEPTH_SUBTYPES
+
 SUPPORTED_AUDIO_EXTENSIONS = {
     ".wav",
     ".mp3",
@@ -31,6 +37,17 @@ SUPPORTED_AUDIO_EXTENSIONS = {
     ".opus",
 }
 
+# Number of distinct filter designs used to approximate the cutoff sweep
+CUTOFF_BINS = 64
+# Samples decoded and filtered per block when streaming a file
+STREAM_BLOCKSIZE = 65536
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Apply a low-pass filter with linearly varying cutoff frequency to each audio file in a folder."
@@ -40,56 +57,179 @@ def parse_args() -> argparse.Namespace:
     # Remove start-cutoff and end-cutoff arguments, will be read from parameters.json
     parser.add_argument("--fps", type=int, default=75, help="Frames per second for CSV annotation.")
     parser.add_argument("--overwrite", action="store_true", help="Overwrite output files if they exist.")
+    parser.add_argument(
+        "--cutoff-bins",
+        type=positive_int,
+        default=CUTOFF_BINS,
+        help="Number of filter designs used to approximate the cutoff sweep (higher gives smoother transitions).",
+    )
+    parser.add_argument(
+        "--bit-depth",
+        choices=sorted(BIT_DEPTH_SUBTYPES),
+        default=None,
+        help="Sample format of written audio; ignored for formats that don't support it (default: the output format's default).",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes.")
     return parser.parse_args()
 
-def iter_audio_files(root: Path) -> list[Path]:
-    return sorted(
-        p
-        for p in root.rglob("*")
-        if p.is_file() and p.suffix.lower() in SUPPORTED_AUDIO_EXTENSIONS
-    )
+def iter_audio_files(root: Path) -> Iterator[Path]:
+    for p in root.rglob("*"):
+        if p.is_file() and p.suffix.lower() in SUPPORTED_AUDIO_EXTENSIONS:
+            yield p
+
+def output_subtype(out_audio: Path, subtype: str | None) -> str | None:
+    # Outputs keep the input's container, and not every container accepts every
+    # subtype (FLAC has no FLOAT, OGG/MP3 have no PCM), so --bit-depth is only
+    # applied where soundfile reports the pair as valid
+    if subtype is None or sf.check_format(out_audio.suffix[1:].upper(), subtype):
+        return subtype
+    return None
 
-def apply_time_varying_lowpass(audio: np.ndarray, sr: int, cutoff_seq: np.ndarray) -> np.ndarray:
-    # Apply a low-pass filter with cutoff changing per frame
-    filtered = np.zeros_like(audio)
-    n_frames = len(cutoff_seq)
+def quantize_cutoffs(cutoff_seq: np.ndarray, n_bins: int = CUTOFF_BINS) -> tuple[np.ndarray, np.ndarray]:
+    # Map each frame's cutoff to one of n_bins evenly spaced cutoffs over the sweep range
+    low, high = float(np.min(cutoff_seq)), float(np.max(cutoff_seq))
+    if high <= low:
+        return np.array([low]), np.zeros(len(cutoff_seq), dtype=np.intp)
+    bin_cutoffs = np.linspace(low, high, n_bins)
+    frame_bins = np.rint((cutoff_seq - low) / (high - low) * (n_bins - 1)).astype(np.intp)
+    return bin_cutoffs, frame_bins
+
+# Keys are bounded by --cutoff-bins times the number of distinct sample rates
+@functools.lru_cache(maxsize=None)
+def _design_butter(order: int, sr: int, cutoff: float) -> np.ndarray:
+    # Normalize to Nyquist and keep the design valid at both ends: very low
+    # cutoffs are floored at a thousandth of Nyquist, high ones capped at 0.99
+    wn = min(max(cutoff / (sr / 2), 0.001), 0.99)
+    sos = scipy.signal.butter(order, wn, btype="low", output="sos")
+    sos.flags.writeable = False
+    return sos
+
+def design_sos_table(bin_cutoffs: np.ndarray, sr: int) -> np.ndarray:
+    # Stack one 4th-order Butterworth design per cutoff bin into a (n_bins, 2, 6) table.
+    # Designs are cached, so files sharing a sample rate and sweep reuse them.
+    return np.stack([_design_butter(4, sr, cutoff) for cutoff in bin_cutoffs.tolist()])
+
+def iter_lowpass_blocks(
+    blocks: Iterable[np.ndarray], sr: int, cutoff_seq: np.ndarray, n_bins: int = CUTOFF_BINS
+) -> Iterator[np.ndarray]:
+    # Apply a low-pass filter with cutoff changing per frame to a stream of
+    # consecutive audio blocks. Consecutive frames that fall in the same cutoff
+    # bin form one run filtered by a single sosfilt call, and the filter state
+    # is carried across runs and blocks so the stream is one causal pass.
     frame_len = int(sr / 75)
-    for i in range(n_frames):
-        start = i * frame_len
-        end = min((i + 1) * frame_len, len(audio))
-        if end <= start:
-            continue
-        segment = audio[start:end]
-        # If segment is too short for filtering, just copy original
-        if len(segment) < 16:
-            filtered[start:end] = segment
+    bin_cutoffs, frame_bins = quantize_cutoffs(cutoff_seq, n_bins)
+    sos_table = design_sos_table(bin_cutoffs, sr)
+
+    run_starts = np.concatenate(([0], np.flatnonzero(np.diff(frame_bins)) + 1))
+    run_sos = list(sos_table[frame_bins[run_starts]])
+    # The last run extends to the end of the stream, so samples past the final
+    # frame are filtered with the last cutoff rather than left unwritten
+    run_ends = (run_starts[1:] * frame_len).tolist() + [np.iinfo(np.int64).max]
+
+    # Runs are visited in order, so the current run is tracked with an index
+    # instead of being searched for on every sosfilt call
+    run = 0
+    zi = None
+    pos = 0
+    for block in blocks:
+        if len(block) == 0:
+            # Nothing to filter, and no first sample to seed the filter state from
+            yield block
             continue
-        cutoff = cutoff_seq[i]
-        nyq = sr / 2
-        norm_cutoff = min(cutoff / nyq, 0.99)
-        b, a = scipy.signal.butter(4, norm_cutoff, btype="low")
-        try:
-            filtered[start:end] = scipy.signal.filtfilt(b, a, segment)
-        except ValueError:
-            filtered[start:end] = segment
-    return filtered
-
-def write_csv(csv_path: Path, cutoff_seq: np.ndarray) -> None:
-    print(csv_path)
+        if zi is None:
+            # Start from the steady state for the first sample to avoid an onset transient
+            zi = scipy.signal.sosfilt_zi(run_sos[0])
+            if block.ndim > 1:
+                zi = zi[:, :, np.newaxis]
+            zi = zi * block[0]
+        filtered = np.empty_like(block)
+        block_end = pos + len(block)
+        start = pos
+        while start < block_end:
+            end = min(run_ends[run], block_end)
+            filtered[start - pos:end - pos], zi = scipy.signal.sosfilt(
+                run_sos[run], block[start - pos:end - pos], axis=0, zi=zi
+            )
+            if end == run_ends[run]:
+                run += 1
+            start = end
+        pos += len(block)
+        yield filtered
+
+def apply_time_varying_lowpass(
+    audio: np.ndarray, sr: int, cutoff_seq: np.ndarray, n_bins: int = CUTOFF_BINS
+) -> np.ndarray:
+    return next(iter_lowpass_blocks([audio], sr, cutoff_seq, n_bins))
+
+def write_csv(csv_path: Path, cutoff_seq: np.ndarray, class_list: list[str]) -> None:
     class_name = csv_path.stem.split('-')[0]
     class_name = class_name[:-2]
-    print(f"Class name: {class_name}")
-    # Load class list from parameters.json
-    param_path = Path(__file__).parent / "raw" / "parameters.json"
-    with param_path.open("r") as f:
-        params = json.load(f)
-    class_list = params["parameter_1"]["classes"]
     class_index = class_list.index(class_name) if class_name in class_list else -1
+    # Same dialect as csv.writer and the committed raw/*.csv: CRLF rows, floats as repr(round(v, 2))
+    body = "\r\n".join(f"{class_index},{round(value, 2)}" for value in cutoff_seq.tolist())
     with csv_path.open("w", newline="") as handle:
-        writer = csv.writer(handle)
-        writer.writerow(["class_index", "cutoff_freq_Hz"])
-        for value in cutoff_seq:
-            writer.writerow([class_index, round(float(value), 2)])
+        handle.write("class_index,cutoff_freq_Hz\r\n" + body + "\r\n")
+
+def write_lowpass_output(
+    out_audio: Path,
+    blocks: Iterable[np.ndarray],
+    sr: int,
+    channels: int,
+    cutoff_seq: np.ndarray,
+    class_list: list[str],
+    n_bins: int = CUTOFF_BINS,
+    subtype: str | None = None,
+) -> None:
+    # Audio is streamed to a temporary sibling and only moved onto out_audio once
+    # it and the CSV are complete, so an interrupted run never leaves a truncated
+    # file that a later exists() check would treat as finished.
+    part_audio = out_audio.with_name(out_audio.name + ".part")
+    try:
+        with sf.SoundFile(
+            part_audio,
+            "w",
+            samplerate=sr,
+            channels=channels,
+            subtype=output_subtype(out_audio, subtype),
+            format=out_audio.suffix[1:].upper(),
+        ) as sink:
+            for filtered in iter_lowpass_blocks(blocks, sr, cutoff_seq, n_bins):
+                sink.write(filtered)
+        write_csv(out_audio.with_suffix(".csv"), cutoff_seq, class_list)
+        os.replace(part_audio, out_audio)
+    finally:
+        part_audio.unlink(missing_ok=True)
+
+def process_one(
+    audio_path: Path,
+    output_dir: Path,
+    start_cutoff: float,
+    end_cutoff: float,
+    fps: int,
+    overwrite: bool,
+    class_list: list[str],
+    n_bins: int = CUTOFF_BINS,
+    subtype: str | None = None,
+) -> str:
+    class_name = audio_path.parent.name
+    base_name = f"{class_name}_{audio_path.stem}{audio_path.suffix}"
+    out_audio = output_dir / base_name
+    if not overwrite and out_audio.exists():
+        return f"Skipping {out_audio.name} (already exists)"
+
+    info = sf.info(str(audio_path))
+    sr = info.samplerate
+    duration = info.frames / sr
+    n_frames = max(1, int(round(duration * fps)))
+    cutoff_seq = np.linspace(start_cutoff, end_cutoff, n_frames)
+
+    # Decode, filter and encode block by block instead of holding the whole file
+    with sf.SoundFile(audio_path) as source:
+        blocks = source.blocks(blocksize=STREAM_BLOCKSIZE, dtype="float32")
+        write_lowpass_output(
+            out_audio, blocks, sr, source.channels, cutoff_seq, class_list, n_bins, subtype
+        )
+    return f"Processed {out_audio.name}: {n_frames} frames, cutoff {start_cutoff}->{end_cutoff} Hz"
 
 def main() -> None:
     args = parse_args()
@@ -97,32 +237,29 @@ def main() -> None:
     output_dir = args.output_dir.resolve()
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Load cutoff parameters from parameters.json
+    # Load cutoff parameters and class list from parameters.json
     param_path = Path(__file__).parent / "raw" / "parameters.json"
     with param_path.open("r") as f:
         params = json.load(f)
     start_cutoff = params["parameter_2"]["start_cutoff"]
     end_cutoff = params["parameter_2"]["end_cutoff"]
+    class_list = params["parameter_1"]["classes"]
 
-    audio_files = iter_audio_files(input_dir)
-    for audio_path in audio_files:
-        class_name = audio_path.parent.name
-        base_name = f"{class_name}_{audio_path.stem}{audio_path.suffix}"
-        out_audio = output_dir / base_name
-        out_csv = out_audio.with_suffix(".csv")
-        if not args.overwrite and out_audio.exists():
-            print(f"Skipping {out_audio.name} (already exists)")
-            continue
-
-        audio, sr = sf.read(audio_path, dtype="float32")
-        duration = len(audio) / sr
-        n_frames = max(1, int(round(duration * args.fps)))
-        cutoff_seq = np.linspace(start_cutoff, end_cutoff, n_frames)
-
-        filtered = apply_time_varying_lowpass(audio, sr, cutoff_seq)
-        sf.write(out_audio, filtered, sr)
-        write_csv(out_csv, cutoff_seq)
-        print(f"Processed {out_audio.name}: {n_frames} frames, cutoff {start_cutoff}->{end_cutoff} Hz")
+    audio_files = sorted(iter_audio_files(input_dir))
+    worker = partial(
+        process_one,
+        output_dir=output_dir,
+        start_cutoff=start_cutoff,
+        end_cutoff=end_cutoff,
+        fps=args.fps,
+        overwrite=args.overwrite,
+        class_list=class_list,
+        n_bins=args.cutoff_bins,
+        subtype=BIT_DEPTH_SUBTYPES.get(args.bit_depth),
+    )
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for message in executor.map(worker, audio_files, chunksize=4):
+            print(message)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file